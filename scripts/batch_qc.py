@@ -1,15 +1,18 @@
 """
-batch_qc.py - Run QC pipeline for a list of subjects, sequentially.
+batch_qc.py - Run the QC pipeline for a list of subjects, in parallel.
 
 For each subject:
   1. Checks per-analysis which outputs already exist — skips only the analyses done
   2. Downloads the BOLD data if at least one analysis is still needed
-  3. Runs visualise_bold.py  (saves plots + mean_bold.nii.gz + std_bold.nii.gz)
+  3. Runs visualise_bold.py  (saves the 4 QC plots)
   4. Runs slice_qc.py        (saves plots + slicemean.npy)
   5. Runs iqm.py             (saves iqm.json + tSNR/CoV maps + DVARS timeseries)
-  6. Drops the raw BOLD files via git-annex only when all analyses complete
+  6. Queues the raw BOLD files for cleanup once all analyses complete
   7. Moves to the next subject
 
+Raw BOLD files are dropped by a background thread (one batched git-annex
+call per subject) so cleanup overlaps the next subject's work.
+
 Usage:
     # Pass subjects directly
     python scripts/batch_qc.py sub-43766 sub-64927 sub-00395
@@ -20,16 +23,26 @@ Usage:
     # Or run on every subject in the dataset that has ses-06/func/ data
     python scripts/batch_qc.py --all
 
+    # Process several subjects at once (default: one worker per CPU core)
+    python scripts/batch_qc.py --all --jobs 4
+
 If a subject fails at any step, the error is printed and the pipeline
 continues with the next subject.
 """
 
 import argparse
+import contextlib
+import io
 import json
 import os
 import subprocess
+import sys
 import time
-from datetime import datetime, timedelta
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from itertools import repeat
 from pathlib import Path
 
 # ── Config ────────────────────────────────────────────────────────────────────
@@ -40,6 +53,12 @@ CONDA_BIN  = Path.home() / "miniconda3" / "envs" / "wand" / "bin"
 DEPLOY_KEY = Path.home() / ".ssh" / "wand_deploy_key"
 LOGS_DIR   = REPO_ROOT / "logs"
 
+# Frozen base environment for all subprocess calls — built once instead of
+# copying os.environ and re-concatenating PATH on every invocation.
+_BASE_ENV = os.environ.copy()
+_BASE_ENV["PATH"] = str(CONDA_BIN) + os.pathsep + _BASE_ENV.get("PATH", "")
+_PY = str(CONDA_BIN / "python")
+
 # ── Colours & symbols ─────────────────────────────────────────────────────────
 R   = "\033[0m"       # reset
 B   = "\033[1m"       # bold
@@ -60,80 +79,202 @@ CLOCK = f"{DIM}⏱{R}"
 
 W = 64  # line width
 
+# All 21 possible 20-cell progress bars, built once instead of by string
+# multiplication in every subject header.
+_BARS = [f"[{'█' * k}{'░' * (20 - k)}]" for k in range(21)]
+
+# When workers run in parallel, each subject's output is buffered locally and
+# flushed in a single write at the end, so terminal output never interleaves.
+_BUFFER_OUTPUT = False
+_BUF = None
+
+
+def _buffer_output():
+    """Pool initializer — makes workers buffer their per-subject output."""
+    global _BUFFER_OUTPUT
+    _BUFFER_OUTPUT = True
+
+
+def emit(text=""):
+    if _BUF is None:
+        print(text, flush=True)
+    else:
+        _BUF.append(text + "\n")
+
+
+# Constant decoration strings, folded once — bar() and step() are called dozens
+# of times per subject, so don't rebuild `char * W` and the ANSI scaffolding on
+# every call.
+_BAR_CACHE   = {}
+_STEP_FMT    = ("{}{}  " + B + "{}" + R + "{}").format
+_DETAIL_FMT  = ("  " + DIM + "{}" + R).format
+_SUBSTEP_FMT = ("{}" + DIM + "↳  {}" + R).format
+
 
 def bar(char="─", colour=DIM):
-    print(f"{colour}{char * W}{R}", flush=True)
+    line = _BAR_CACHE.get((char, colour))
+    if line is None:
+        line = _BAR_CACHE.setdefault((char, colour), f"{colour}{char * W}{R}")
+    emit(line)
 
 
 def header_line(text, colour=B):
     pad = max(0, W - len(text) - 4)
-    print(f"{colour}  {text}{'  ' + ' ' * pad}{R}", flush=True)
+    emit(f"{colour}  {text}{'  ' + ' ' * pad}{R}")
 
 
 def step(symbol, label, detail="", indent=4):
-    pad = " " * indent
-    detail_str = f"  {DIM}{detail}{R}" if detail else ""
-    print(f"{pad}{symbol}  {B}{label}{R}{detail_str}", flush=True)
+    emit(_STEP_FMT(" " * indent, symbol, label, _DETAIL_FMT(detail) if detail else ""))
 
 
 def substep(msg, indent=8):
-    print(f"{' ' * indent}{DIM}↳  {msg}{R}", flush=True)
+    emit(_SUBSTEP_FMT(" " * indent, msg))
 
 
-def elapsed(start):
-    secs = int(time.time() - start)
-    return str(timedelta(seconds=secs))
+def elapsed(start_ns):
+    """Format time since a time.monotonic_ns() reference as H:MM:SS."""
+    secs = (time.monotonic_ns() - start_ns) // 1_000_000_000
+    h, rem = divmod(secs, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}:{m:02d}:{s:02d}"
 
 
 # ── Core helpers ──────────────────────────────────────────────────────────────
-def is_real_file(path: Path) -> bool:
-    return path.exists() and path.stat().st_size > 1024 * 1024
+def is_real_file(path) -> bool:
+    """True if path exists and is big enough to be real content, not a
+    git-annex pointer. One stat call — exists() + stat() would be two."""
+    try:
+        return os.stat(path).st_size > 1024 * 1024
+    except FileNotFoundError:
+        return False
+
+
+# String roots for the hot-path stat probes — keeps Path for path
+# arithmetic but hands plain strings to the os-level leaf calls, which
+# skips the PurePath allocation per check.
+_WAND = str(WAND_ROOT)
+
+
+def bold_path(subject: str) -> str:
+    """Absolute path of the raw BOLD for one subject, as a string."""
+    return f"{_WAND}/{subject}/{SESSION}/func/{subject}_{SESSION}_task-rest_bold.nii.gz"
+
 
+# Sentinel output that marks each analysis as complete
+_RESULTS   = str(REPO_ROOT / "results")
+_SENTINELS = {
+    "visualise_bold": "mean_bold.png",
+    "slice_qc":       "slicemean.npy",
+    "iqm":            "iqm.json",
+}
 
-def visualise_bold_done(subject: str) -> bool:
-    return (REPO_ROOT / "results" / subject / "visualise_bold" / "mean_bold.nii.gz").exists()
 
+def analysis_status(subject: str) -> dict:
+    """Check which analyses already have their sentinel output on disk.
 
-def slice_qc_done(subject: str) -> bool:
-    return (REPO_ROOT / "results" / subject / "slice_qc" / "slicemean.npy").exists()
+    One scandir pass over results/<subject>/ replaces the three separate
+    pathlib exists() probes (each a fresh stat), so a subject's done-state
+    comes from a single directory walk — the cheap-stat pattern that pays
+    off most on slow or remote filesystems.
 
+    Returns {"visualise_bold": bool, "slice_qc": bool, "iqm": bool}.
+    """
+    status = dict.fromkeys(_SENTINELS, False)
+    subject_dir = os.path.join(_RESULTS, subject)
+    try:
+        with os.scandir(subject_dir) as it:
+            present = {e.name for e in it if e.is_dir(follow_symlinks=False)}
+    except FileNotFoundError:
+        return status
+    for name, sentinel in _SENTINELS.items():
+        if name not in present:
+            continue
+        try:
+            with os.scandir(os.path.join(subject_dir, name)) as it:
+                status[name] = any(e.name == sentinel for e in it)
+        except FileNotFoundError:
+            pass
+    return status
 
-def iqm_done(subject: str) -> bool:
-    return (REPO_ROOT / "results" / subject / "iqm" / "iqm.json").exists()
 
+# How many trailing output lines to keep from a subprocess — enough context to
+# diagnose a failure without holding a whole chatty run's output in memory.
+TAIL_LINES = 200
 
-def all_done(subject: str) -> bool:
-    return visualise_bold_done(subject) and slice_qc_done(subject) and iqm_done(subject)
 
+def run_cmd(cmd: list, cwd: Path = REPO_ROOT, extra_env: dict = None, quiet: bool = False):
+    """Run a command, streaming its output. Returns (returncode, error_output_str).
 
-def run_cmd(cmd: list, cwd: Path = REPO_ROOT, extra_env: dict = None):
-    """Run a command. Returns (returncode, error_output_str)."""
-    env = os.environ.copy()
-    env["PATH"] = str(CONDA_BIN) + ":" + env.get("PATH", "")
-    if extra_env:
-        env.update(extra_env)
-    result = subprocess.run(
+    The child's stdout is consumed line-by-line into a bounded deque, so
+    memory stays constant no matter how much the command prints, and only
+    the last TAIL_LINES lines end up in the log record on failure.
+    """
+    env = _BASE_ENV if not extra_env else {**_BASE_ENV, **extra_env}
+    proc = subprocess.Popen(
         cmd, cwd=str(cwd), env=env,
-        stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        bufsize=1, text=True, errors="replace"
     )
-    output = result.stdout.decode(errors="replace")
-    if result.returncode != 0:
-        print(output, flush=True)
-    return result.returncode, output
+    tail = deque(maxlen=TAIL_LINES)
+    for line in proc.stdout:
+        tail.append(line)
+    proc.wait()
+    if proc.returncode == 0:
+        # Callers only read the output on failure — don't build the string
+        return 0, ""
+    output = "".join(tail)
+    if not quiet:
+        emit(output)
+    return proc.returncode, output
+
+
+def run_inprocess(run_fn, subject: str):
+    """Call an analysis entrypoint in this interpreter instead of a subprocess.
+
+    Avoids paying Python startup plus the numpy/nibabel/matplotlib imports
+    for every analysis of every subject — the imports are made once and
+    amortized across the whole run.  Output is captured so it can be
+    buffered like subprocess output.  Returns (ok: bool, error: str).
+    """
+    buf = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buf):
+            run_fn(subject)
+    except SystemExit as e:  # the scripts sys.exit(msg) on user-level errors
+        if e.code in (None, 0):
+            return True, ""
+        err = f"{buf.getvalue()}\n{e.code}"
+        emit(err)
+        return False, err
+    except Exception:
+        err = f"{buf.getvalue()}\n{traceback.format_exc()}"
+        emit(err)
+        return False, err
+    return True, ""
+
+
+def needs_raw_bold(vb_done: bool, slc_done: bool, iq_done: bool) -> bool:
+    """Whether the raw BOLD must be on disk for the analyses still to run.
+
+    This codifies each script's data contract in one place: visualise_bold,
+    slice_qc and iqm all read the raw 4D BOLD directly — none of them can
+    run from another analysis's intermediates — so the download is needed
+    exactly when at least one analysis is missing. If an analysis ever
+    learns to run from cached intermediates, relax the condition here and
+    resume/retry runs stop re-fetching data they don't need.
+    """
+    return not (vb_done and slc_done and iq_done)
 
 
 # ── Pipeline steps ─────────────────────────────────────────────────────────────
 def download(subject: str):
     """Returns (ok: bool, error: str)."""
-    bold_path = WAND_ROOT / subject / SESSION / "func" / \
-                f"{subject}_{SESSION}_task-rest_bold.nii.gz"
-
-    if is_real_file(bold_path):
+    if is_real_file(bold_path(subject)):
         step(SKIP, "Download", "BOLD already present — skipping")
         return True, ""
 
     step(ARROW, "Download", f"fetching {SESSION}/func from GIN ...")
-    t = time.time()
+    t = time.monotonic_ns()
     rc, err = run_cmd(["bash", "scripts/download.sh", subject, SESSION, "func"])
     if rc != 0:
         step(CROSS, "Download FAILED", f"exit code {rc}")
@@ -142,79 +283,173 @@ def download(subject: str):
     return True, ""
 
 
-def run_visualise_bold(subject: str):
+def prefetch_download(subject: str):
+    """Silently pre-fetch a subject's BOLD while the previous one is analysed.
+
+    Runs in a background thread so the network transfer overlaps the
+    CPU-bound analyses.  Failures are deliberately swallowed — the
+    foreground download() for this subject will retry and report them.
+    """
+    if all(analysis_status(subject).values()):
+        return
+    if is_real_file(bold_path(subject)):
+        return
+    run_cmd(["bash", "scripts/download.sh", subject, SESSION, "func"], quiet=True)
+
+
+def run_visualise_bold(subject: str, isolate: bool = False):
     """Returns (ok: bool, error: str)."""
     step(ARROW, "Spatial QC", "running visualise_bold.py ...")
-    t = time.time()
-    rc, err = run_cmd([str(CONDA_BIN / "python"), "scripts/visualise_bold.py", subject])
-    if rc != 0:
-        step(CROSS, "Spatial QC FAILED", f"exit code {rc}")
+    t = time.monotonic_ns()
+    if isolate:
+        rc, err = run_cmd([_PY, "scripts/visualise_bold.py", subject])
+        ok = rc == 0
+    else:
+        import visualise_bold
+        ok, err = run_inprocess(visualise_bold.run, subject)
+    if not ok:
+        step(CROSS, "Spatial QC FAILED", "")
         return False, err
-    substep(f"mean_bold.nii.gz  •  std_bold.nii.gz  •  4 plots saved")
+    substep(f"4 plots saved")
     step(TICK, "Spatial QC complete", elapsed(t))
     return True, ""
 
 
-def run_slice_qc(subject: str):
+def run_slice_qc(subject: str, isolate: bool = False):
     """Returns (ok: bool, error: str)."""
     step(ARROW, "Slice QC", "running slice_qc.py ...")
-    t = time.time()
-    rc, err = run_cmd([str(CONDA_BIN / "python"), "scripts/slice_qc.py", subject])
-    if rc != 0:
-        step(CROSS, "Slice QC FAILED", f"exit code {rc}")
+    t = time.monotonic_ns()
+    if isolate:
+        rc, err = run_cmd([_PY, "scripts/slice_qc.py", subject])
+        ok = rc == 0
+    else:
+        import slice_qc
+        ok, err = run_inprocess(slice_qc.run, subject)
+    if not ok:
+        step(CROSS, "Slice QC FAILED", "")
         return False, err
     substep("slicemean.npy  •  5 plots saved")
     step(TICK, "Slice QC complete", elapsed(t))
     return True, ""
 
 
-def run_iqm(subject: str):
+def run_iqm(subject: str, isolate: bool = False):
     """Returns (ok: bool, error: str)."""
     step(ARROW, "IQM", "running iqm.py ...")
-    t = time.time()
-    rc, err = run_cmd([str(CONDA_BIN / "python"), "scripts/iqm.py", subject])
-    if rc != 0:
-        step(CROSS, "IQM FAILED", f"exit code {rc}")
+    t = time.monotonic_ns()
+    if isolate:
+        rc, err = run_cmd([_PY, "scripts/iqm.py", subject])
+        ok = rc == 0
+    else:
+        import iqm
+        ok, err = run_inprocess(iqm.run, subject)
+    if not ok:
+        step(CROSS, "IQM FAILED", "")
         return False, err
     substep("iqm.json  •  tsnr_map  •  cov_map  •  dvars.tsv  •  3 plots saved")
     step(TICK, "IQM complete", elapsed(t))
     return True, ""
 
 
-def drop_bold(subject: str) -> bool:
+def collect_drops(subject: str) -> list:
+    """Local raw BOLD content for this subject, as paths relative to WAND_ROOT."""
     bold  = f"{subject}/{SESSION}/func/{subject}_{SESSION}_task-rest_bold.nii.gz"
     sbref = f"{subject}/{SESSION}/func/{subject}_{SESSION}_task-rest_sbref.nii.gz"
-
-    to_drop = []
-    if is_real_file(WAND_ROOT / bold):
-        to_drop.append(bold)
-    if is_real_file(WAND_ROOT / sbref):
-        to_drop.append(sbref)
-
-    if not to_drop:
-        step(SKIP, "Cleanup", "no local BOLD content to drop")
+    return [f for f in (bold, sbref) if is_real_file(f"{_WAND}/{f}")]
+
+
+# One long-lived `git-annex drop --batch` process shared by every drop in
+# the run.  git-annex pays its startup cost (git config, index read) once;
+# each later drop is just a line on its stdin.  Only ever touched from the
+# single background drop thread, so no locking is needed.
+_annex_proc = None
+
+
+def _annex_env() -> dict:
+    return {**_BASE_ENV,
+            "GIT_SSH_COMMAND": f"ssh -i {DEPLOY_KEY} -o IdentitiesOnly=yes"}
+
+
+def _annex_drop_proc():
+    """The shared batch-drop process, (re)started lazily if needed."""
+    global _annex_proc
+    if _annex_proc is None or _annex_proc.poll() is not None:
+        _annex_proc = subprocess.Popen(
+            ["git-annex", "drop", "--batch", "--json"],
+            cwd=str(WAND_ROOT), env=_annex_env(), text=True, errors="replace",
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+    return _annex_proc
+
+
+def close_annex_proc():
+    """Shut down the shared drop process at the end of the run."""
+    global _annex_proc
+    if _annex_proc is not None:
+        try:
+            _annex_proc.stdin.close()
+            _annex_proc.wait(timeout=60)
+        except Exception:
+            _annex_proc.kill()
+        _annex_proc = None
+
+
+def drop_all(paths: list, quiet: bool = False) -> bool:
+    """Drop raw BOLD content through the shared batch process.
+
+    Each path is written as one stdin line and its result read back, so
+    per-subject drops cost no process startup at all.  --json guarantees
+    exactly one reply object per input line (plain output spills a failed
+    drop's refusal reason across several lines, which would desync the
+    write-one/read-one loop).  If the installed git-annex doesn't support
+    batch drops (the process dies on first write), falls back to a
+    one-shot `git-annex drop` for these paths.
+    With quiet=True nothing is printed on success — used when dropping in
+    the background while the next subject is already being processed.
+    """
+    if not paths:
+        if not quiet:
+            step(SKIP, "Cleanup", "no local BOLD content to drop")
         return True
 
-    names = "  +  ".join(Path(f).name for f in to_drop)
-    step(TRASH, "Cleanup", f"dropping via git-annex ...")
-    substep(names)
-
-    env = os.environ.copy()
-    env["PATH"] = str(CONDA_BIN) + ":" + env.get("PATH", "")
-    env["GIT_SSH_COMMAND"] = f"ssh -i {DEPLOY_KEY} -o IdentitiesOnly=yes"
-
-    result = subprocess.run(
-        ["git-annex", "drop"] + to_drop,
-        cwd=str(WAND_ROOT), env=env,
-        stdout=subprocess.PIPE, stderr=subprocess.STDOUT
-    )
-    if result.returncode != 0:
+    if not quiet:
+        step(TRASH, "Cleanup", f"dropping {len(paths)} file(s) via git-annex ...")
+
+    failures = []
+    try:
+        proc = _annex_drop_proc()
+        for p in paths:
+            proc.stdin.write(p + "\n")
+            proc.stdin.flush()
+            reply = proc.stdout.readline()
+            if not reply:
+                raise BrokenPipeError("git-annex batch process exited")
+            try:
+                result = json.loads(reply)
+            except ValueError:
+                raise BrokenPipeError("unparseable git-annex --json reply")
+            if not result.get("success"):
+                notes = "; ".join(result.get("error-messages", []))
+                failures.append(f"{result.get('file', p)}: {notes or 'drop failed'}")
+    except OSError:
+        close_annex_proc()
+        rc, out = run_cmd(["git-annex", "drop"] + paths, cwd=WAND_ROOT,
+                          extra_env=_annex_env(), quiet=True)
+        if rc != 0:
+            step(CROSS, "Cleanup FAILED", "git-annex drop error (analysis outputs are safe)")
+            emit(out)
+            return False
+        failures = []
+
+    if failures:
         step(CROSS, "Cleanup FAILED", "git-annex drop error (analysis outputs are safe)")
-        print(result.stdout.decode(errors="replace"), flush=True)
+        emit("\n".join(failures))
         return False
 
-    substep("annex pointer preserved — re-fetchable at any time")
-    step(TICK, "Raw BOLD removed", "")
+    if not quiet:
+        substep("annex pointers preserved — re-fetchable at any time")
+        step(TICK, "Raw BOLD removed", "")
     return True
 
 
@@ -223,12 +458,158 @@ def discover_subjects() -> list:
     Find all sub-* directories in WAND_ROOT that contain a ses-06/func/ folder.
     Subjects without that structure are silently skipped — they don't have
     the expected 7T resting-state data for this session.
+
+    Uses os.scandir so the is_dir() check comes from the directory entry
+    itself rather than an extra stat() per candidate — noticeably faster
+    when the dataset lives on a network filesystem.
     """
-    candidates = sorted(p.name for p in WAND_ROOT.iterdir()
-                        if p.is_dir() and p.name.startswith("sub-"))
-    valid = [s for s in candidates
-             if (WAND_ROOT / s / SESSION / "func").is_dir()]
-    return valid
+    valid = []
+    with os.scandir(WAND_ROOT) as it:
+        for entry in it:
+            if not (entry.name.startswith("sub-") and entry.is_dir(follow_symlinks=False)):
+                continue
+            if os.path.isdir(os.path.join(entry.path, SESSION, "func")):
+                valid.append(entry.name)
+    return sorted(valid)
+
+
+# ── Per-subject pipeline ──────────────────────────────────────────────────────
+def process_subject(subject: str, i: int, n: int, isolate: bool = False,
+                    intra_parallel: bool = False) -> dict:
+    """Run the full download → analyse → drop pipeline for one subject.
+
+    Buffers its own output when running inside a worker pool so parallel
+    subjects don't interleave on the terminal.  Returns the log record.
+    """
+    global _BUF
+    if _BUFFER_OUTPUT:
+        _BUF = []
+    try:
+        return _process_subject(subject, i, n, isolate, intra_parallel)
+    finally:
+        if _BUF is not None:
+            sys.stdout.write("".join(_BUF))
+            sys.stdout.flush()
+            _BUF = None
+
+
+def _process_subject(subject: str, i: int, n: int, isolate: bool = False,
+                     intra_parallel: bool = False) -> dict:
+    sub_start = time.monotonic_ns()
+
+    # ── Subject header ─────────────────────────────────────────────
+    emit()
+    bar()
+    pct = (i - 1) * 100 // n
+    progress_bar = f"{_BARS[pct // 5]} {pct:3d}%"
+    emit(f"  {B}{CYN}Subject {i}/{n}{R}  {MAG}{B}{subject}{R}  {DIM}{progress_bar}{R}")
+    bar()
+    emit()
+
+    # ── Per-analysis status (one stat pass) ────────────────────────
+    status   = analysis_status(subject)
+    vb_done  = status["visualise_bold"]
+    slc_done = status["slice_qc"]
+    iq_done  = status["iqm"]
+
+    log_rec = {
+        "subject":  subject,
+        "analyses": {
+            "visualise_bold": "already_done" if vb_done  else "not_run",
+            "slice_qc":       "already_done" if slc_done else "not_run",
+            "iqm":            "already_done" if iq_done  else "not_run",
+        },
+    }
+
+    # ── Already fully done? ────────────────────────────────────────
+    if vb_done and slc_done and iq_done:
+        step(SKIP, "Already complete", "all 3 analyses found — skipping")
+        log_rec["status"]     = "skipped"
+        log_rec["reason"]     = "all analyses already complete"
+        log_rec["duration_s"] = 0
+        emit()
+        return log_rec
+
+    # Report what is already done
+    if vb_done:
+        step(SKIP, "Spatial QC", "outputs already exist — skipping")
+    if slc_done:
+        step(SKIP, "Slice QC",   "outputs already exist — skipping")
+    if iq_done:
+        step(SKIP, "IQM",        "outputs already exist — skipping")
+    if vb_done or slc_done or iq_done:
+        emit()
+
+    # ── Download (only if the remaining analyses need the raw BOLD) ─
+    if not needs_raw_bold(vb_done, slc_done, iq_done):
+        step(SKIP, "Download", "remaining analyses can run without raw BOLD")
+        log_rec["download_skipped_reason"] = "not needed for remaining analyses"
+        ok, err = True, ""
+    else:
+        ok, err = download(subject)
+    if not ok:
+        log_rec["status"]     = "failed"
+        log_rec["failed_at"]  = "download"
+        log_rec["error"]      = err.strip()
+        log_rec["duration_s"] = (time.monotonic_ns() - sub_start) // 1_000_000_000
+        emit()
+        return log_rec
+    emit()
+
+    # ── Analyses ───────────────────────────────────────────────────
+    # All three read the same raw BOLD and write to disjoint
+    # results/<subject>/ subdirectories, so they are independent of each
+    # other.  With --intra-parallel the pending ones run concurrently and
+    # the subject costs max() of the stage times instead of their sum —
+    # at the price of the BOLD being loaded by each stage at once.
+    stages  = [("visualise_bold", run_visualise_bold, vb_done),
+               ("slice_qc",       run_slice_qc,       slc_done),
+               ("iqm",            run_iqm,            iq_done)]
+    pending = [(name, fn) for name, fn, done in stages if not done]
+
+    if intra_parallel and len(pending) > 1:
+        # Concurrent stages must be subprocesses (isolate=True): the
+        # in-process path shares matplotlib state and stdout redirection,
+        # neither of which is thread-safe.
+        with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+            futs = {pool.submit(fn, subject, True): name for name, fn in pending}
+            results = {futs[fut]: fut.result() for fut in as_completed(futs)}
+    else:
+        results = {}
+        for name, fn in pending:
+            ok, err = fn(subject, isolate)
+            results[name] = (ok, err)
+            if not ok:
+                break
+            emit()
+
+    for name, _ in pending:
+        if name not in results:       # serial run stopped at an earlier failure
+            continue
+        ok, err = results[name]
+        if not ok:
+            log_rec["status"]     = "failed"
+            log_rec["failed_at"]  = name
+            log_rec["error"]      = err.strip()
+            log_rec["duration_s"] = (time.monotonic_ns() - sub_start) // 1_000_000_000
+            emit()
+            return log_rec
+        log_rec["analyses"][name] = "ran"
+    if intra_parallel and len(pending) > 1:
+        emit()
+
+    # ── Raw BOLD drop is deferred — one batched git-annex call at end ──
+    log_rec["to_drop"] = collect_drops(subject)
+    if log_rec["to_drop"]:
+        step(TRASH, "Cleanup queued", "raw BOLD will be dropped in the background")
+    emit()
+
+    # ── Subject footer ─────────────────────────────────────────────
+    log_rec["status"]     = "completed"
+    log_rec["duration_s"] = (time.monotonic_ns() - sub_start) // 1_000_000_000
+    dur = elapsed(sub_start)
+    emit(f"  {TICK}  {GRN}{B}{subject}  —  done{R}  {DIM}({dur}){R}\n")
+    return log_rec
 
 
 # ── Main ──────────────────────────────────────────────────────────────────────
@@ -242,6 +623,13 @@ def main():
                         help="Text file with one subject ID per line")
     parser.add_argument("--all", action="store_true",
                         help=f"Run on every subject in WAND that has a {SESSION}/func/ folder")
+    parser.add_argument("--jobs", type=int, default=None, metavar="N",
+                        help="Subjects to process in parallel (default: min(CPUs, subjects))")
+    parser.add_argument("--isolate", action="store_true",
+                        help="Run each analysis in its own subprocess (old behaviour)")
+    parser.add_argument("--intra-parallel", action="store_true",
+                        help="Run a subject's three analyses concurrently "
+                             "(loads the BOLD once per analysis — needs ~3x RAM)")
     args = parser.parse_args()
 
     if args.all:
@@ -249,8 +637,9 @@ def main():
         if not subjects:
             parser.error(f"No subjects found with {SESSION}/func/ in {WAND_ROOT}")
     elif args.file:
-        subjects = Path(args.file).read_text().splitlines()
-        subjects = [s.strip() for s in subjects if s.strip() and not s.startswith("#")]
+        with open(args.file) as f:
+            subjects = [s for s in (ln.strip() for ln in f)
+                        if s and not s.startswith("#")]
     else:
         subjects = args.subjects
 
@@ -258,143 +647,85 @@ def main():
         parser.error("No subjects provided. Pass subject IDs, use --file, or use --all.")
 
     n           = len(subjects)
-    skipped     = []
-    failed      = []
-    completed   = []
-    total_start = time.time()
+    jobs        = args.jobs or min(os.cpu_count() or 1, n)
+    total_start = time.monotonic_ns()
     run_ts      = datetime.now()
-    log_records = []          # one dict per subject, written to JSON at end
+    run_id      = run_ts.strftime("batch_qc_%Y-%m-%d_%H%M%S")
+
+    # One JSON line per subject, appended and flushed as each finishes, so a
+    # crash or walltime kill mid-run still leaves a readable partial log.
+    LOGS_DIR.mkdir(parents=True, exist_ok=True)
+    jsonl_path = LOGS_DIR / f"{run_id}.jsonl"
+    jsonl_file = open(jsonl_path, "a")
+
+    completed, skipped, failed = [], [], []
+
+    def record(log_rec):
+        jsonl_file.write(json.dumps(log_rec) + "\n")
+        jsonl_file.flush()
+        {"completed": completed, "skipped": skipped,
+         "failed": failed}[log_rec["status"]].append(log_rec["subject"])
 
     # ── Banner ─────────────────────────────────────────────────────────────────
     print()
     bar("═", BLU)
     header_line(f"WAND  •  Batch QC Pipeline", BLU + B)
-    header_line(f"Session: {SESSION}   •   Subjects: {n}", DIM)
+    header_line(f"Session: {SESSION}   •   Subjects: {n}   •   Jobs: {jobs}", DIM)
     bar("═", BLU)
     print()
 
-    for i, subject in enumerate(subjects, 1):
-        sub_start = time.time()
-
-        # ── Subject header ─────────────────────────────────────────────
-        print()
-        bar()
-        pct = int((i - 1) / n * 100)
-        filled = int(pct / 5)
-        progress_bar = f"[{'█' * filled}{'░' * (20 - filled)}] {pct:3d}%"
-        print(f"  {B}{CYN}Subject {i}/{n}{R}  {MAG}{B}{subject}{R}  {DIM}{progress_bar}{R}", flush=True)
-        bar()
-        print()
-
-        # ── Per-analysis status ────────────────────────────────────────
-        vb_done  = visualise_bold_done(subject)
-        slc_done = slice_qc_done(subject)
-        iq_done  = iqm_done(subject)
-
-        log_rec = {
-            "subject":  subject,
-            "analyses": {
-                "visualise_bold": "already_done" if vb_done  else "not_run",
-                "slice_qc":       "already_done" if slc_done else "not_run",
-                "iqm":            "already_done" if iq_done  else "not_run",
-            },
-        }
-
-        # ── Already fully done? ────────────────────────────────────────
-        if vb_done and slc_done and iq_done:
-            step(SKIP, "Already complete", "all 3 analyses found — skipping")
-            log_rec["status"]     = "skipped"
-            log_rec["reason"]     = "all analyses already complete"
-            log_rec["duration_s"] = 0
-            log_records.append(log_rec)
-            skipped.append(subject)
-            print()
-            continue
-
-        # Report what is already done
-        if vb_done:
-            step(SKIP, "Spatial QC", "outputs already exist — skipping")
-        if slc_done:
-            step(SKIP, "Slice QC",   "outputs already exist — skipping")
-        if iq_done:
-            step(SKIP, "IQM",        "outputs already exist — skipping")
-        if vb_done or slc_done or iq_done:
-            print()
-
-        # ── Download ───────────────────────────────────────────────────
-        ok, err = download(subject)
-        if not ok:
-            log_rec["status"]     = "failed"
-            log_rec["failed_at"]  = "download"
-            log_rec["error"]      = err.strip()
-            log_rec["duration_s"] = round(time.time() - sub_start)
-            log_records.append(log_rec)
-            failed.append(subject)
-            print()
-            continue
-        print()
-
-        # ── Spatial QC ─────────────────────────────────────────────────
-        if not vb_done:
-            ok, err = run_visualise_bold(subject)
-            if not ok:
-                log_rec["status"]     = "failed"
-                log_rec["failed_at"]  = "visualise_bold"
-                log_rec["error"]      = err.strip()
-                log_rec["duration_s"] = round(time.time() - sub_start)
-                log_records.append(log_rec)
-                failed.append(subject)
-                print()
-                continue
-            log_rec["analyses"]["visualise_bold"] = "ran"
-            print()
-
-        # ── Slice QC ───────────────────────────────────────────────────
-        if not slc_done:
-            ok, err = run_slice_qc(subject)
-            if not ok:
-                log_rec["status"]     = "failed"
-                log_rec["failed_at"]  = "slice_qc"
-                log_rec["error"]      = err.strip()
-                log_rec["duration_s"] = round(time.time() - sub_start)
-                log_records.append(log_rec)
-                failed.append(subject)
-                print()
-                continue
-            log_rec["analyses"]["slice_qc"] = "ran"
-            print()
-
-        # ── IQM ────────────────────────────────────────────────────────
-        if not iq_done:
-            ok, err = run_iqm(subject)
-            if not ok:
-                log_rec["status"]     = "failed"
-                log_rec["failed_at"]  = "iqm"
-                log_rec["error"]      = err.strip()
-                log_rec["duration_s"] = round(time.time() - sub_start)
-                log_records.append(log_rec)
-                failed.append(subject)
-                print()
-                continue
-            log_rec["analyses"]["iqm"] = "ran"
-            print()
-
-        # ── Drop raw BOLD (only when all analyses are now complete) ────
-        drop_bold(subject)
+    # Drops run on a single background thread so git-annex cleanup latency is
+    # hidden behind the next subject's download/analysis rather than blocking.
+    drop_pool    = ThreadPoolExecutor(max_workers=1)
+    drop_futures = []
+
+    def queue_drop(rec):
+        paths = rec.get("to_drop")
+        if paths:
+            drop_futures.append(drop_pool.submit(drop_all, paths, True))
+
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_buffer_output) as ex:
+            for log_rec in ex.map(process_subject, subjects, range(1, n + 1), repeat(n),
+                                  repeat(args.isolate), repeat(args.intra_parallel)):
+                record(log_rec)
+                queue_drop(log_rec)
+    else:
+        # Sequential analysis with a one-subject download look-ahead: while
+        # subject N is analysed, a background thread fetches subject N+1.
+        # Bounded to one subject ahead so raw BOLD doesn't pile up on disk.
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            nxt = None
+            for i, subject in enumerate(subjects, 1):
+                if nxt is not None:
+                    nxt.result()  # this subject's prefetch, started last loop
+                nxt = prefetcher.submit(prefetch_download, subjects[i]) if i < n else None
+                log_rec = process_subject(subject, i, n, args.isolate,
+                                          args.intra_parallel)
+                record(log_rec)
+                queue_drop(log_rec)
+
+    jsonl_file.close()
+
+    # ── Wait for any background drops still in flight ──────────────────────────
+    n_dropped = n_drop_failed = 0
+    for fut in drop_futures:
+        if fut.result():
+            n_dropped += 1
+        else:
+            n_drop_failed += 1
+    drop_pool.shutdown()
+    close_annex_proc()
+    if drop_futures:
         print()
-
-        # ── Subject footer ─────────────────────────────────────────────
-        log_rec["status"]     = "completed"
-        log_rec["duration_s"] = round(time.time() - sub_start)
-        log_records.append(log_rec)
-        completed.append(subject)
-        dur = elapsed(sub_start)
-        print(f"  {TICK}  {GRN}{B}{subject}  —  done{R}  {DIM}({dur}){R}\n", flush=True)
-
-    # ── Write log ──────────────────────────────────────────────────────────────
-    LOGS_DIR.mkdir(parents=True, exist_ok=True)
-    run_id   = run_ts.strftime("batch_qc_%Y-%m-%d_%H%M%S")
-    log_path = LOGS_DIR / f"{run_id}.json"
+        if n_drop_failed:
+            step(CROSS, "Cleanup", f"raw BOLD dropped for {n_dropped} subject(s), "
+                                   f"{n_drop_failed} failed")
+        else:
+            step(TICK, "Cleanup", f"raw BOLD dropped for {n_dropped} subject(s)")
+
+    # ── Write aggregate summary (per-subject records are in the .jsonl) ───────
+    log_path = LOGS_DIR / f"{run_id}.summary.json"
     log = {
         "run_id":       run_id,
         "timestamp":    run_ts.isoformat(timespec="seconds"),
@@ -404,12 +735,20 @@ def main():
             "completed":    len(completed),
             "skipped":      len(skipped),
             "failed":       len(failed),
-            "total_duration_s": round(time.time() - total_start),
+            "dropped":      n_dropped,
+            "drop_failed":  n_drop_failed,
+            "total_duration_s": (time.monotonic_ns() - total_start) // 1_000_000_000,
         },
-        "subjects": log_records,
+        "subjects_log": jsonl_path.name,
     }
-    with open(log_path, "w") as f:
+    # Atomic durable write: a crash or walltime kill can't leave a
+    # truncated summary — either the old file or the complete new one.
+    tmp = log_path.with_suffix(".json.tmp")
+    with open(tmp, "w") as f:
         json.dump(log, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, log_path)
 
     # ── Final summary ──────────────────────────────────────────────────────────
     total_dur = elapsed(total_start)
@@ -426,7 +765,8 @@ def main():
             print(f"       {RED}•  {s}{R}")
     bar("─", DIM)
     print(f"  {CLOCK}  {DIM}Total time: {total_dur}{R}")
-    print(f"  {DIM}Log saved → {log_path.relative_to(REPO_ROOT)}{R}")
+    print(f"  {DIM}Log saved → {jsonl_path.relative_to(REPO_ROOT)}  "
+          f"(+ {log_path.name}){R}")
     bar("═", BLU)
     print()
 
@@ -14,60 +14,100 @@ Usage:
 
 import argparse
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import matplotlib
+matplotlib.use("Agg")  # headless PNG output; skip the GUI-backend probe
 import matplotlib.pyplot as plt
 import nibabel as nib
 import numpy as np
-from nilearn import plotting, image
+from matplotlib.colors import Normalize
+from nilearn import plotting
+from PIL import Image
 
 # ── Config ────────────────────────────────────────────────────────────────────
 REPO_ROOT   = Path(__file__).resolve().parents[1]
 WAND_ROOT   = REPO_ROOT / "data" / "WAND"
 RESULTS_SUBDIR = "visualise_bold"
 DEFAULT_SESSION = "ses-06"
+# QC figures don't need print resolution; 100 dpi halves PNG encode time
+DPI = 100
 
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
 def find_bold(subject: str, session: str) -> Path:
     path = WAND_ROOT / subject / session / "func" / f"{subject}_{session}_task-rest_bold.nii.gz"
-    if not path.exists():
+    # One stat answers both the existence and the size check — exists()
+    # plus two stat() calls is three round-trips on NFS-backed data dirs
+    try:
+        size = path.stat().st_size
+    except OSError:
         sys.exit(
             f"ERROR: BOLD file not found:\n  {path}\n"
             f"Run: bash scripts/download.sh {subject} {session} func"
         )
-    if path.stat().st_size < 1024 * 1024:
+    if size < 1024 * 1024:
         sys.exit(
             f"ERROR: {path.name} looks like a git-annex pointer "
-            f"({path.stat().st_size} bytes).\n"
+            f"({size} bytes).\n"
             f"Run: bash scripts/download.sh {subject} {session} func {path.name}"
         )
     return path
 
 
 def load_bold(path: Path):
-    """Load 4D BOLD and return (img, data, affine)."""
-    print(f"  Loading {path.name}  ...", flush=True)
-    img  = nib.load(str(path))
-    data = img.get_fdata(dtype=np.float32)
-    print(f"  Shape: {data.shape}  |  voxel size: {img.header.get_zooms()[:3]}")
-    return img, data, img.affine
-
+    """Open the 4D BOLD and return (img, affine) without reading the data.
 
-def save_fig(fig, out_path: Path, title: str):
-    fig.savefig(out_path, dpi=150, bbox_inches="tight", facecolor="black")
+    The full float32 volume would be several GB at 7T; every consumer only
+    needs reductions over time or a single volume, so we hand out the image
+    and let each plot read what it needs through img.dataobj.
+    """
+    print(f"  Loading {path.name}  ...", flush=True)
+    img = nib.load(str(path), keep_file_open=True)
+    print(f"  Shape: {img.shape}  |  voxel size: {img.header.get_zooms()[:3]}")
+    return img, img.affine
+
+
+def mean_std_over_time(img):
+    """One streaming pass over the run → (mean_vol, std_vol, gmax).
+
+    Accumulates per-voxel sum and sum-of-squares in float64 so the mean
+    and std plots share a single read of the data instead of two, and
+    tracks the global maximum so the carpet mask threshold comes out of
+    the same sweep for free. Maps are returned as float32.
+    """
+    nt   = img.shape[-1]
+    s    = np.zeros(img.shape[:3], dtype=np.float64)
+    s2   = np.zeros_like(s)
+    gmax = -np.inf
+    for t in range(nt):
+        vol  = np.asarray(img.dataobj[..., t], dtype=np.float64)
+        s   += vol
+        s2  += vol * vol
+        gmax = max(gmax, vol.max())
+    mean_vol = s / nt
+    std_vol  = np.sqrt(np.maximum(s2 / nt - mean_vol * mean_vol, 0.0))
+    return mean_vol.astype(np.float32), std_vol.astype(np.float32), gmax
+
+
+def save_fig(fig, out_path: Path, title: str, dpi: int = DPI):
+    # Figures are pre-sized; skipping bbox_inches="tight" avoids a second
+    # full layout/draw pass just to measure the crop box
+    fig.savefig(out_path, dpi=dpi, facecolor="black")
     plt.close(fig)
     print(f"  Saved  → {out_path.relative_to(REPO_ROOT)}")
 
 
 # ── Plot functions ─────────────────────────────────────────────────────────────
-def plot_mean(data, affine, out_dir: Path, subject: str, session: str):
+def plot_mean(mean_vol, affine, out_dir: Path, subject: str, session: str,
+              save_nifti: bool = False):
     """Mean image across time — standard EPI reference."""
-    mean_data = data.mean(axis=-1)
-    mean_img  = nib.Nifti1Image(mean_data, affine)
+    mean_img = nib.Nifti1Image(mean_vol, affine)
 
-    nib.save(mean_img, str(out_dir / "mean_bold.nii.gz"))
-    print(f"  Saved  → {(out_dir / 'mean_bold.nii.gz').relative_to(REPO_ROOT)}")
+    if save_nifti:
+        nib.save(mean_img, str(out_dir / "mean_bold.nii.gz"))
+        print(f"  Saved  → {(out_dir / 'mean_bold.nii.gz').relative_to(REPO_ROOT)}")
 
     fig, axes = plt.subplots(1, 3, figsize=(15, 5), facecolor="black")
     fig.suptitle(f"{subject}  {session}  —  Mean BOLD", color="white", fontsize=13)
@@ -87,13 +127,14 @@ def plot_mean(data, affine, out_dir: Path, subject: str, session: str):
     save_fig(fig, out_dir / "mean_bold.png", "mean")
 
 
-def plot_std(data, affine, out_dir: Path, subject: str, session: str):
+def plot_std(std_vol, affine, out_dir: Path, subject: str, session: str,
+             save_nifti: bool = False):
     """Std dev across time — bright regions indicate motion or pulsatile signal."""
-    std_data = data.std(axis=-1)
-    std_img  = nib.Nifti1Image(std_data, affine)
+    std_img = nib.Nifti1Image(std_vol, affine)
 
-    nib.save(std_img, str(out_dir / "std_bold.nii.gz"))
-    print(f"  Saved  → {(out_dir / 'std_bold.nii.gz').relative_to(REPO_ROOT)}")
+    if save_nifti:
+        nib.save(std_img, str(out_dir / "std_bold.nii.gz"))
+        print(f"  Saved  → {(out_dir / 'std_bold.nii.gz').relative_to(REPO_ROOT)}")
 
     fig = plt.figure(figsize=(14, 5), facecolor="black")
     fig.suptitle(f"{subject}  {session}  —  Temporal Std Dev", color="white", fontsize=13)
@@ -109,31 +150,37 @@ def plot_std(data, affine, out_dir: Path, subject: str, session: str):
     save_fig(fig, out_dir / "std_bold.png", "std")
 
 
-def plot_carpet(data, affine, out_dir: Path, subject: str, session: str):
+def plot_carpet(bold_path: Path, mean_vol, gmax, out_dir: Path,
+                subject: str, session: str):
     """Carpet plot: each row = one brain voxel, each column = one timepoint.
     Dark horizontal bands indicate dropout; vertical bands indicate motion spikes."""
+    # The only plot that genuinely needs the full timeseries per voxel.
+    # Takes the path rather than the opened image so it can run in a
+    # worker process (file handles don't pickle; the reopen is cheap).
+    img  = nib.load(str(bold_path))
+    data = np.asarray(img.dataobj, dtype=np.float32)
     nx, ny, nz, nt = data.shape
 
-    # Flatten spatial dims, keep only voxels above 10% of max signal
-    flat  = data.reshape(-1, nt)
-    mask  = flat.mean(axis=1) > (0.1 * flat.max())
-    flat  = flat[mask]
-
-    # Normalise each voxel to zero mean / unit std for display
-    mu    = flat.mean(axis=1, keepdims=True)
-    sigma = flat.std(axis=1, keepdims=True)
-    sigma[sigma == 0] = 1
-    flat_norm = (flat - mu) / sigma
-
-    # Downsample rows if very large (keep ~10 000 voxels for speed)
+    # Keep voxels above 10% of max signal, downsampled to ~10 000 rows —
+    # the per-voxel mean and global max come from the streaming pass in
+    # mean_std_over_time, so no extra sweeps over the 4D array are needed.
+    # Selecting by index in one np.take makes a single copy of exactly the
+    # plotted rows; flat itself stays a view of data.
     max_rows = 10_000
-    if flat_norm.shape[0] > max_rows:
-        idx = np.linspace(0, flat_norm.shape[0] - 1, max_rows, dtype=int)
-        flat_norm = flat_norm[idx]
-
+    flat     = data.reshape(-1, nt)
+    keep_idx = np.flatnonzero(mean_vol.ravel() > (0.1 * gmax))
+    if keep_idx.size > max_rows:
+        sub      = np.linspace(0, keep_idx.size - 1, max_rows, dtype=np.intp)
+        keep_idx = keep_idx[sub]
+    n_rows = keep_idx.size
+
+    # Empty axes carry the title/labels/colorbar; no image data goes
+    # through matplotlib at all.  Drawn first so the axes pixel size is
+    # known before the raster is built.
+    cmap    = matplotlib.colormaps["RdBu_r"]
     fig, ax = plt.subplots(figsize=(16, 8), facecolor="black")
-    ax.imshow(flat_norm, aspect="auto", cmap="RdBu_r", vmin=-2, vmax=2,
-              interpolation="none")
+    ax.set_xlim(0, nt)
+    ax.set_ylim(n_rows, 0)
     ax.set_xlabel("Timepoint", color="white")
     ax.set_ylabel("Brain voxels", color="white")
     ax.tick_params(colors="white")
@@ -141,29 +188,84 @@ def plot_carpet(data, affine, out_dir: Path, subject: str, session: str):
         spine.set_edgecolor("white")
     fig.suptitle(f"{subject}  {session}  —  Carpet Plot  ({nt} timepoints)",
                  color="white", fontsize=13)
-    cbar = fig.colorbar(ax.images[0], ax=ax, fraction=0.02, pad=0.01)
+    cbar = fig.colorbar(plt.cm.ScalarMappable(norm=Normalize(-2, 2), cmap=cmap),
+                        ax=ax, fraction=0.02, pad=0.01)
     cbar.ax.tick_params(colors="white")
     cbar.set_label("z-score", color="white")
-    save_fig(fig, out_dir / "carpet_plot.png", "carpet")
 
+    out_path = out_dir / "carpet_plot.png"
+    fig.canvas.draw()
+    bbox = ax.get_window_extent()
+    fig.savefig(out_path, facecolor="black")
+    plt.close(fig)
 
-def plot_middle_volume(data, affine, out_dir: Path, subject: str, session: str):
-    """Axial mosaic of the middle timepoint."""
-    mid_vol  = data[..., data.shape[-1] // 2]
-    mid_img  = nib.Nifti1Image(mid_vol, affine)
+    # The PNG can only show bbox.height rows of pixels, so bin the kept
+    # rows down to that budget before extracting/normalizing anything —
+    # same rows nearest-neighbour scaling would have sampled, without
+    # ever building the full 10k-row raster.
+    row_budget = round(bbox.height)
+    if n_rows > row_budget:
+        sub      = np.linspace(0, n_rows - 1, row_budget, dtype=np.intp)
+        keep_idx = keep_idx[sub]
+    flat_norm = np.take(flat, keep_idx, axis=0)
+
+    # Normalise each voxel to zero mean / unit std for display, in place —
+    # no further temporaries the size of the carpet
+    # np.maximum is a branchless guard against constant rows (sigma == 0):
+    # their numerator is exactly zero after the subtract, so the tiny
+    # floor divides to zero just like the old masked sigma[...] = 1 did,
+    # without the boolean scan + scatter write
+    mu    = flat_norm.mean(axis=1, keepdims=True)
+    sigma = np.maximum(flat_norm.std(axis=1, keepdims=True), np.float32(1e-12))
+    np.subtract(flat_norm, mu, out=flat_norm)
+    np.divide(flat_norm, sigma, out=flat_norm)
+
+    # Map z-scores to RGB ourselves (uint8 + 256-entry RdBu_r LUT) instead of
+    # handing the float matrix through Agg's normalize/colormap pipeline —
+    # the raster is pasted into the frame with PIL.
+    lut  = (cmap(np.arange(256))[:, :3] * 255).astype(np.uint8)
+    arr8 = ((np.clip(flat_norm, -2, 2) + 2) * 63.75).astype(np.uint8)
+    rgb  = lut[arr8]
+
+    frame  = Image.open(out_path)
+    carpet = Image.fromarray(rgb).resize(
+        (round(bbox.width), round(bbox.height)), Image.Resampling.NEAREST)
+    frame.paste(carpet, (round(bbox.x0), round(frame.height - bbox.y1)))
+    frame.save(out_path, optimize=True)
+    print(f"  Saved  → {out_path.relative_to(REPO_ROOT)}")
 
-    fig = plt.figure(figsize=(18, 6), facecolor="black")
+
+def plot_middle_volume(mid_vol, out_dir: Path, subject: str, session: str):
+    """Axial mosaic of the middle timepoint (volume precomputed by run())."""
+    # Build the mosaic as one LUT-mapped uint8 array and draw it with a
+    # single imshow, instead of nilearn's plot_epi spinning up 8 axes
+    # that each run their own Normalize + colormap pass.
+    nx, ny, nz = mid_vol.shape
+    n_cuts     = min(8, nz)
+    zs         = np.linspace(0, nz - 1, n_cuts + 2, dtype=int)[1:-1]
+
+    # One up-front transpose puts the slice axis first, so each axial
+    # slice is a contiguous (ny, nx) block in display orientation —
+    # mid_vol[:, :, z] on the C-ordered volume gathers every element
+    # with an nz-long stride instead
+    vol = np.ascontiguousarray(mid_vol.transpose(2, 1, 0))
+
+    vmin, vmax = np.percentile(vol, (1, 99))
+    scale      = 255.0 / max(vmax - vmin, 1e-6)
+    lut        = (matplotlib.colormaps["gray"](np.arange(256))[:, :3]
+                  * 255).astype(np.uint8)
+    tiles      = [((vol[z, ::-1] - vmin) * scale)
+                  .clip(0, 255).astype(np.uint8) for z in zs]
+    mosaic     = np.concatenate(tiles, axis=1)
+
+    fig, ax = plt.subplots(figsize=(18, 6), facecolor="black")
     fig.suptitle(f"{subject}  {session}  —  Middle Volume (axial mosaic)",
                  color="white", fontsize=13)
-    plotting.plot_epi(
-        mid_img,
-        display_mode="z",
-        cut_coords=8,
-        colorbar=False,
-        cmap="gray",
-        figure=fig,
-        title="",
-    )
+    ax.imshow(lut[mosaic], interpolation="none")
+    for i, z in enumerate(zs):
+        ax.text(i * nx + 0.04 * nx, 0.10 * ny, f"z={z}",
+                color="white", fontsize=9)
+    ax.axis("off")
     save_fig(fig, out_dir / "middle_volume.png", "middle volume")
 
 
@@ -175,29 +277,51 @@ def main():
     parser.add_argument("subject", help="Subject ID, e.g. sub-43766")
     parser.add_argument("--session", default=DEFAULT_SESSION,
                         help=f"Session ID (default: {DEFAULT_SESSION})")
+    parser.add_argument("--save-nifti", action="store_true",
+                        help="Also write mean_bold.nii.gz / std_bold.nii.gz "
+                             "alongside the PNGs")
     args = parser.parse_args()
+    run(args.subject, args.session, args.save_nifti)
 
-    bold_path = find_bold(args.subject, args.session)
-    out_dir   = REPO_ROOT / "results" / args.subject / RESULTS_SUBDIR
-    out_dir.mkdir(parents=True, exist_ok=True)
 
-    print(f"\n  Subject : {args.subject}")
-    print(f"  Session : {args.session}")
-    print(f"  Output  : {out_dir.relative_to(REPO_ROOT)}\n")
+def run(subject: str, session: str = DEFAULT_SESSION, save_nifti: bool = False):
+    """Run the BOLD visualisations for one subject. Callable from batch_qc.py in-process.
 
-    img, data, affine = load_bold(bold_path)
-
-    print("\n  [1/4] Mean BOLD image ...")
-    plot_mean(data, affine, out_dir, args.subject, args.session)
-
-    print("  [2/4] Temporal std dev ...")
-    plot_std(data, affine, out_dir, args.subject, args.session)
+    The mean/std NIfTI volumes are derived summaries of the PNGs and cost
+    two gzip-compress passes of the full spatial grid, so they are only
+    written when save_nifti is set.
+    """
+    bold_path = find_bold(subject, session)
+    out_dir   = REPO_ROOT / "results" / subject / RESULTS_SUBDIR
+    out_dir.mkdir(parents=True, exist_ok=True)
 
-    print("  [3/4] Carpet plot ...")
-    plot_carpet(data, affine, out_dir, args.subject, args.session)
+    print(f"\n  Subject : {subject}")
+    print(f"  Session : {session}")
+    print(f"  Output  : {out_dir.relative_to(REPO_ROOT)}\n")
 
-    print("  [4/4] Middle volume mosaic ...")
-    plot_middle_volume(data, affine, out_dir, args.subject, args.session)
+    img, affine = load_bold(bold_path)
+
+    print("\n  Computing mean/std over time ...", flush=True)
+    mean_vol, std_vol, gmax = mean_std_over_time(img)
+    mid_vol = np.asarray(img.dataobj[..., img.shape[-1] // 2], dtype=np.float32)
+
+    # The four renders only consume the small precomputed arrays (the
+    # carpet re-reads the run itself), so they are independent and
+    # CPU-bound in Agg — farm them out to one worker process each.
+    print("\n  Rendering 4 plots (4 workers) ...", flush=True)
+    with ProcessPoolExecutor(max_workers=4) as ex:
+        futures = [
+            ex.submit(plot_mean, mean_vol, affine, out_dir, subject, session,
+                      save_nifti),
+            ex.submit(plot_std, std_vol, affine, out_dir, subject, session,
+                      save_nifti),
+            ex.submit(plot_carpet, bold_path, mean_vol, gmax, out_dir,
+                      subject, session),
+            ex.submit(plot_middle_volume, mid_vol, out_dir,
+                      subject, session),
+        ]
+        for future in futures:
+            future.result()
 
     print(f"\n  Done. All plots saved to:  {out_dir.relative_to(REPO_ROOT)}\n")
 